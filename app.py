@@ -1,19 +1,63 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, send_file, session
+import asyncio
+import atexit
+import collections
+import functools
+import hashlib
+import itertools
 import os
-import requests
+import re
+import httpx
+import orjson
 import random
-import json
-from datetime import datetime
+import tempfile
+import threading
+import time
+import unicodedata
+from datetime import datetime, timezone
 import google.generativeai as genai
+import redis
+from google.api_core import exceptions as google_exceptions
 from dotenv import load_dotenv
+from flask.json.provider import JSONProvider
+from flask_session import Session
 import urllib.parse
 
 load_dotenv()
 
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson: faster encode/decode than stdlib
+    json. Responses get orjson's bytes directly via response(); dumps
+    returns str because the cookie-session serializer (itsdangerous)
+    delegates here and requires text."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj),
+                                        mimetype="application/json")
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'default-secret-key')
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
+# Server-side sessions: requests carry a 32-byte session ID instead of
+# the whole history/current-question payload in an HMAC-signed cookie
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config['SESSION_REDIS'] = redis.from_url(REDIS_URL)
+    app.config['SESSION_SERIALIZATION_FORMAT'] = 'msgpack'
+    Session(app)
+else:
+    print("Warning: REDIS_URL not set, falling back to cookie sessions")
+
 # Configure Gemini
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 FOURSQUARE_API_KEY = os.getenv('FOURSQUARE_API_KEY')
@@ -21,8 +65,59 @@ FOURSQUARE_API_KEY = os.getenv('FOURSQUARE_API_KEY')
 if not FOURSQUARE_API_KEY:
     print("Warning: FOURSQUARE_API_KEY not set")
 
+# Dedicated long-lived event loop for all httpx work. Flask async views
+# each run on a fresh short-lived loop, so keep-alive connections must
+# live on a loop that survives the request
+_io_loop = asyncio.new_event_loop()
+threading.Thread(target=_io_loop.run_forever, name='http-io-loop',
+                 daemon=True).start()
+
+def run_in_io_loop(coro):
+    # Submit a coroutine to the shared I/O loop from any thread or loop
+    return asyncio.run_coroutine_threadsafe(coro, _io_loop)
+
+# Shared HTTP/2 client for Foursquare calls so both requests per question
+# multiplex over a single warm TLS connection instead of re-handshaking
+FSQ = httpx.AsyncClient(
+    http2=True,
+    headers={
+        "Accept": "application/json",
+        "Authorization": FOURSQUARE_API_KEY or ""
+    },
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+    timeout=5.0
+)
+
+# Plain client for fetching photo bytes from the Foursquare CDN; no API
+# headers needed there
+IMG = httpx.AsyncClient(timeout=10.0, follow_redirects=True)
+
+def _close_clients():
+    try:
+        run_in_io_loop(FSQ.aclose()).result(timeout=5)
+        run_in_io_loop(IMG.aclose()).result(timeout=5)
+    except Exception:
+        pass
+
+atexit.register(_close_clients)
+
 genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.0-flash')
+# Ask for raw JSON so replies normally arrive without markdown fences
+model = genai.GenerativeModel(
+    'gemini-2.0-flash',
+    generation_config={'response_mime_type': 'application/json'})
+
+# First {...} or [...] span in a reply, fences/prose around it ignored
+_JSON_RE = re.compile(r'[\[{].*[\]}]', re.S)
+
+# First correct_answer field in a partially streamed reply
+_ANSWER_RE = re.compile(r'"correct_answer"\s*:\s*"([^"]+)"')
+
+def _extract_json(text):
+    match = _JSON_RE.search(text)
+    if not match:
+        raise ValueError("No JSON found in model response")
+    return orjson.loads(match.group(0))
 
 # Predefined questions as fallback
 FALLBACK_QUESTIONS = [
@@ -56,6 +151,80 @@ FALLBACK_QUESTIONS = [
     }
 ]
 
+# Pre-generated question pool so /get_question usually pops a ready
+# question in O(1) instead of waiting out a multi-second Gemini call
+POOL_SIZE = 16
+POOL_LOW_WATER = 4
+# Questions requested per Gemini call; latency is dominated by
+# connection plus first-token time, so a batch costs barely more than
+# a single question
+POOL_BATCH_SIZE = 10
+POOL_FILE = os.getenv('QUESTION_POOL_FILE',
+                      os.path.join(tempfile.gettempdir(), 'geography_quiz_pool.json'))
+QUESTION_POOL = {d: collections.deque(maxlen=POOL_SIZE) for d in ('easy', 'medium', 'hard')}
+_pool_lock = threading.Lock()
+
+def _load_pool():
+    try:
+        with open(POOL_FILE, 'rb') as f:
+            saved = orjson.loads(f.read())
+        with _pool_lock:
+            for difficulty, questions in saved.items():
+                if difficulty in QUESTION_POOL:
+                    QUESTION_POOL[difficulty].extend(questions)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Error loading question pool: {str(e)}")
+
+def _save_pool():
+    try:
+        with _pool_lock:
+            snapshot = {d: list(pool) for d, pool in QUESTION_POOL.items()}
+        with open(POOL_FILE, 'wb') as f:
+            f.write(orjson.dumps(snapshot))
+    except Exception as e:
+        print(f"Error saving question pool: {str(e)}")
+
+def _refill_pool_loop():
+    delay = 5
+    while True:
+        refilled = False
+        failed = False
+        for difficulty, pool in QUESTION_POOL.items():
+            if len(pool) < POOL_LOW_WATER:
+                try:
+                    questions = generate_questions_with_gemini(difficulty)
+                except Exception as e:
+                    print(f"Error refilling {difficulty} pool: {str(e)}")
+                    failed = True
+                    continue
+                with _pool_lock:
+                    pool.extend(questions)
+                refilled = True
+        if refilled:
+            _save_pool()
+        # Back off exponentially (with jitter, capped at 5 min) while
+        # Gemini keeps failing instead of re-hitting it every cycle
+        delay = min(300, delay * 2) if failed else 5
+        time.sleep(delay + random.random())
+
+_load_pool()
+if GEMINI_API_KEY:
+    threading.Thread(target=_refill_pool_loop, name='question-pool-refill',
+                     daemon=True).start()
+
+# Cap on per-session dedupe hashes; oldest entries are evicted first
+USED_HASHES_MAX = 256
+
+# Cap on per-session answer history; oldest entries are evicted first
+HISTORY_MAX = 50
+
+def _question_hash(text):
+    # Stable 64-bit hash: 8 bytes per seen question in the session
+    # instead of the full question string
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'big')
+
 def init_session():
     if 'score' not in session:
         session['score'] = 0
@@ -65,104 +234,220 @@ def init_session():
         session['history'] = []
     if 'current_question' not in session:
         session['current_question'] = None
-    if 'used_questions' not in session:
-        session['used_questions'] = []
+    if 'used_q_hashes' not in session:
+        session['used_q_hashes'] = []
 
-def generate_question(difficulty):
-    try:
-        prompt = f"""
-        Generate a unique world geography multiple-choice question with these requirements:
-        - Difficulty level: {difficulty}
-        - 1 correct answer and 3 plausible incorrect answers
-        - Include a brief hint
-        - Format as valid JSON with these exact keys:
-        {{
-            "question": "question text",
-            "options": ["option1", "option2", "option3", "option4"],
-            "correct_answer": "correct option",
-            "hint": "helpful hint",
-            "difficulty": "{difficulty}"
-        }}
-        Return ONLY the JSON object, no additional text or markdown.
-        Make sure the options are clear and distinct from each other.
-        """
-        
+PROMPT_TEMPLATE = """
+    Generate {count} unique world geography multiple-choice questions with these requirements:
+    - Difficulty level: {difficulty}
+    - Each question has 1 correct answer and 3 plausible incorrect answers
+    - Include a brief hint for each question
+    - Format as a valid JSON array where every element has these exact keys:
+    {{
+        "question": "question text",
+        "options": ["option1", "option2", "option3", "option4"],
+        "correct_answer": "correct option",
+        "hint": "helpful hint",
+        "difficulty": "{difficulty}"
+    }}
+    Return ONLY the JSON array, no additional text or markdown.
+    Make sure the options are clear and distinct from each other.
+    """
+
+# Rendered once per difficulty: each call is a dict lookup, and the
+# byte-identical prompt maximizes Gemini's implicit prompt-cache hits
+PROMPTS = {d: PROMPT_TEMPLATE.format(count=POOL_BATCH_SIZE, difficulty=d)
+           for d in ('easy', 'medium', 'hard')}
+
+def generate_questions_with_gemini(difficulty, count=POOL_BATCH_SIZE,
+                                   on_first_answer=None):
+    if count == POOL_BATCH_SIZE and difficulty in PROMPTS:
+        prompt = PROMPTS[difficulty]
+    else:
+        prompt = PROMPT_TEMPLATE.format(count=count, difficulty=difficulty)
+
+    if on_first_answer is None:
         response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        
-        # Clean response text
-        if response_text.startswith('```json'):
-            response_text = response_text[7:-3].strip()
-        elif response_text.startswith('```'):
-            response_text = response_text[3:-3].strip()
-        
-        question_data = json.loads(response_text)
-        
-        # Validate response
-        required_keys = ['question', 'options', 'correct_answer', 'hint', 'difficulty']
+        response_text = response.text
+    else:
+        # Stream the reply so the first correct_answer can kick off
+        # work (an image prefetch) while the rest is still arriving
+        parts = []
+        notified = False
+        for chunk in model.generate_content(prompt, stream=True):
+            parts.append(chunk.text)
+            if not notified:
+                match = _ANSWER_RE.search(''.join(parts))
+                if match:
+                    notified = True
+                    on_first_answer(match.group(1))
+        response_text = ''.join(parts)
+
+    questions = _extract_json(response_text)
+    if isinstance(questions, dict):
+        questions = [questions]
+
+    # Validate each question, dropping malformed ones
+    required_keys = ['question', 'options', 'correct_answer', 'hint', 'difficulty']
+    valid_questions = []
+    for question_data in questions:
         if not all(key in question_data for key in required_keys):
-            raise ValueError("Missing required fields in response")
-        
+            continue
         if len(question_data['options']) != 4:
-            raise ValueError("Exactly 4 options required")
-            
+            continue
         if question_data['correct_answer'] not in question_data['options']:
-            raise ValueError("Correct answer must be one of the options")
-            
-        if question_data['question'] in session.get('used_questions', []):
-            raise ValueError("Duplicate question generated")
-        
-        # Shuffle options while keeping track of correct answer
-        options = question_data['options'].copy()
-        correct_answer = question_data['correct_answer']
-        random.shuffle(options)
-        
-        # Update the question data with shuffled options
-        question_data['options'] = options
-            
-        return question_data
-        
-    except Exception as e:
-        print(f"Error generating question with Gemini: {str(e)}")
-        # Fallback to predefined questions
-        available_questions = [q for q in FALLBACK_QUESTIONS 
-                            if q['question'] not in session.get('used_questions', [])]
-        
+            continue
+        valid_questions.append(question_data)
+
+    if not valid_questions:
+        raise ValueError("No valid questions in response")
+
+    return valid_questions
+
+# All 24 orderings of a 4-option list, so shuffling is one RNG draw
+# and an index instead of three Fisher-Yates swaps
+OPTION_PERMS = tuple(itertools.permutations(range(4)))
+
+def generate_question(difficulty, on_first_answer=None, allow_gemini=True):
+    used_hashes = set(session.get('used_q_hashes', []))
+    question_data = None
+
+    # Serve from the pre-generated pool first; rotate past any question
+    # this session has already seen
+    with _pool_lock:
+        pool = QUESTION_POOL[difficulty]
+        for _ in range(len(pool)):
+            candidate = pool.popleft()
+            if _question_hash(candidate['question']) not in used_hashes:
+                question_data = candidate
+                break
+            pool.append(candidate)
+
+    # Pool empty (or exhausted for this session): fall back to a
+    # synchronous Gemini call; serve one question and bank the rest
+    if question_data is None and allow_gemini:
+        try:
+            batch = generate_questions_with_gemini(
+                difficulty, on_first_answer=on_first_answer)
+            fresh = [q for q in batch
+                     if _question_hash(q['question']) not in used_hashes]
+            if not fresh:
+                raise ValueError("Duplicate question generated")
+            question_data = fresh[0]
+            with _pool_lock:
+                QUESTION_POOL[difficulty].extend(fresh[1:])
+        except (google_exceptions.InvalidArgument,
+                google_exceptions.ResourceExhausted,
+                google_exceptions.ServiceUnavailable):
+            # Surface real API errors so the caller's retry policy can
+            # tell rate limits from permanent rejections
+            raise
+        except Exception as e:
+            print(f"Error generating question with Gemini: {str(e)}")
+            question_data = None
+
+    # Last resort: predefined fallback questions
+    if question_data is None:
+        available_questions = [q for q in FALLBACK_QUESTIONS
+                            if _question_hash(q['question']) not in used_hashes]
         if available_questions:
-            question = random.choice(available_questions)
-            # Shuffle options for fallback questions too
-            options = question['options'].copy()
-            random.shuffle(options)
-            question['options'] = options
-            return question
+            question_data = random.choice(available_questions)
         else:
             # If all fallbacks used, reset and reuse
-            session['used_questions'] = []
-            question = random.choice(FALLBACK_QUESTIONS)
-            options = question['options'].copy()
-            random.shuffle(options)
-            question['options'] = options
-            return question
-
-def get_location_image(query):
+            session['used_q_hashes'] = []
+            question_data = random.choice(FALLBACK_QUESTIONS)
+
+    # Shuffle options while keeping track of correct answer
+    question_data = dict(question_data)
+    perm = OPTION_PERMS[random.randrange(24)]
+    question_data['options'] = [question_data['options'][i] for i in perm]
+
+    return question_data
+
+# Photo URL cache keyed by normalized answer text, so repeat landmarks
+# (including accent/case spelling variants like "Brasília"/"brasilia")
+# skip the two Foursquare round-trips entirely
+_IMAGE_CACHE = {}
+_IMAGE_CACHE_TTL = 30 * 24 * 3600
+_IMAGE_CACHE_MAX = 1024
+
+# Misses are remembered briefly too, so answers Foursquare cannot
+# resolve don't re-pay the two round-trips on every reappearance
+_MISS_CACHE = {}
+_MISS_CACHE_TTL = 3600
+_MISS_CACHE_MAX = 1024
+
+def _cache_put(cache, key, value, max_entries):
+    # Dicts iterate in insertion order, so evicting the first key is
+    # FIFO - the same cap-and-evict scheme as the session hash list
+    cache[key] = value
+    while len(cache) > max_entries:
+        del cache[next(iter(cache))]
+
+# Lookups currently in flight, keyed like the caches above. Everything
+# runs on the shared I/O loop, so this needs no lock
+_INFLIGHT = {}
+
+# The constant part of the search query, encoded once at import
+_QUERY_SUFFIX = urllib.parse.quote(" landmark location")
+
+def _normalize_query(query):
+    # Casefold and strip diacritics so spelling variants share one entry
+    decomposed = unicodedata.normalize('NFKD', query.strip().casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+async def get_location_image(query):
     if not FOURSQUARE_API_KEY:
         return None
-        
+
+    cache_key = _normalize_query(query)
+    cached = _IMAGE_CACHE.get(cache_key)
+    if cached is not None:
+        if time.monotonic() - cached[1] < _IMAGE_CACHE_TTL:
+            return cached[0]
+        del _IMAGE_CACHE[cache_key]
+
+    miss_ts = _MISS_CACHE.get(cache_key)
+    if miss_ts is not None:
+        if time.monotonic() - miss_ts < _MISS_CACHE_TTL:
+            return None
+        del _MISS_CACHE[cache_key]
+
+    # If a lookup for this key is already running (e.g. the mid-stream
+    # prefetch), share its result instead of issuing a second API pair
+    task = _INFLIGHT.get(cache_key)
+    if task is not None:
+        return await task
+
+    task = asyncio.ensure_future(_fetch_location_image(query))
+    _INFLIGHT[cache_key] = task
+    try:
+        image_url = await task
+    finally:
+        _INFLIGHT.pop(cache_key, None)
+
+    if image_url is None:
+        _cache_put(_MISS_CACHE, cache_key, time.monotonic(), _MISS_CACHE_MAX)
+    else:
+        _cache_put(_IMAGE_CACHE, cache_key, (image_url, time.monotonic()),
+                   _IMAGE_CACHE_MAX)
+    return image_url
+
+async def _gather_option_images(options):
+    return await asyncio.gather(*(get_location_image(option) for option in options))
+
+async def _fetch_location_image(query):
     try:
         # Clean and prepare the query
         query = query.strip()
-        # URL encode the query
-        encoded_query = urllib.parse.quote(f"{query} landmark location")
-        
+        # URL encode only the variable part; the suffix is pre-encoded
+        encoded_query = urllib.parse.quote(query) + _QUERY_SUFFIX
+
         url = f"https://api.foursquare.com/v3/places/search?query={encoded_query}&limit=1"
-        headers = {
-            "Accept": "application/json",
-            "Authorization": FOURSQUARE_API_KEY
-        }
-        
+
         # Make the initial search request
         try:
-            response = requests.get(url, headers=headers, timeout=5)
+            response = await FSQ.get(url)
             response.raise_for_status()
             data = response.json()
         except Exception as e:
@@ -176,7 +461,7 @@ def get_location_image(query):
         try:
             place_id = data['results'][0]['fsq_id']
             photo_url = f"https://api.foursquare.com/v3/places/{place_id}/photos?limit=1"
-            photo_response = requests.get(photo_url, headers=headers, timeout=5)
+            photo_response = await FSQ.get(photo_url)
             photo_response.raise_for_status()
             photos = photo_response.json()
         except Exception as e:
@@ -187,28 +472,96 @@ def get_location_image(query):
             photo = photos[0]
             # Use a smaller image size for faster loading
             return f"{photo['prefix']}300x300{photo['suffix']}"
-            
+
         return None
         
     except Exception as e:
-        print(f"Error in get_location_image: {str(e)}")
+        print(f"Error in _fetch_location_image: {str(e)}")
         return None
 
+# On-disk cache of proxied photo bytes; served with a long max-age so
+# browsers stop refetching the same landmarks from Foursquare
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR',
+                            os.path.join(tempfile.gettempdir(), 'geography_quiz_images'))
+os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+IMAGE_MAX_AGE = 604800  # one week
+
+# Hosts the proxy will fetch from; keeps /img from being an open proxy
+_ALLOWED_IMAGE_HOSTS = ('4sqi.net',)
+
+_DIGEST_RE = re.compile(r'[0-9a-f]{40}')
+
+def _allowed_image_url(image_url):
+    if not image_url.startswith('https://'):
+        return False
+    host = urllib.parse.urlsplit(image_url).hostname or ''
+    return any(host == allowed or host.endswith('.' + allowed)
+               for allowed in _ALLOWED_IMAGE_HOSTS)
+
+def _proxy_image_url(image_url):
+    # Map an upstream photo URL to a stable, cacheable /img path. The
+    # URL rides along as a query param so any worker process can
+    # resolve it without shared state; the digest pins it down
+    if not image_url:
+        return image_url
+    digest = hashlib.sha1(image_url.encode()).hexdigest()
+    return f"/img/{digest}?u={urllib.parse.quote(image_url, safe='')}"
+
+@app.route('/img/<digest>')
+async def serve_image(digest):
+    if not _DIGEST_RE.fullmatch(digest):
+        return jsonify({'error': 'Image not found'}), 404
+
+    path = os.path.join(IMAGE_CACHE_DIR, digest)
+    if not os.path.exists(path):
+        image_url = request.args.get('u', '')
+        if hashlib.sha1(image_url.encode()).hexdigest() != digest:
+            return jsonify({'error': 'Image not found'}), 404
+        if not _allowed_image_url(image_url):
+            return jsonify({'error': 'Image not found'}), 404
+        try:
+            upstream = await asyncio.wrap_future(run_in_io_loop(IMG.get(image_url)))
+            upstream.raise_for_status()
+        except Exception as e:
+            print(f"Error proxying image: {str(e)}")
+            return jsonify({'error': 'Image not found'}), 404
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(upstream.content)
+        os.replace(tmp_path, path)
+
+    response = send_file(path, mimetype='image/jpeg', max_age=IMAGE_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={IMAGE_MAX_AGE}, immutable'
+    return response
+
+# Single compiled scan plus dict dispatch instead of repeated
+# substring passes over the query for every call
+KEYWORD_RE = re.compile(
+    r'(ocean|sea|pacific|atlantic|mountain|mount|mt|desert|sahara'
+    r'|forest|jungle|city|capital)', re.I)
+KEYWORD_TO_IMAGE = {
+    'ocean': "/static/images/ocean.jpg",
+    'sea': "/static/images/ocean.jpg",
+    'pacific': "/static/images/ocean.jpg",
+    'atlantic': "/static/images/ocean.jpg",
+    'mountain': "/static/images/mountain.jpg",
+    'mount': "/static/images/mountain.jpg",
+    'mt': "/static/images/mountain.jpg",
+    'desert': "/static/images/desert.jpg",
+    'sahara': "/static/images/desert.jpg",
+    'forest': "/static/images/forest.jpg",
+    'jungle': "/static/images/forest.jpg",
+    'city': "/static/images/city.jpg",
+    'capital': "/static/images/city.jpg",
+}
+
+@functools.lru_cache(maxsize=1024)
 def get_default_image(query):
     # Return appropriate default images based on the type of location
-    query_lower = query.lower()
-    if any(word in query_lower for word in ['ocean', 'sea', 'pacific', 'atlantic']):
-        return "/static/images/ocean.jpg"
-    elif any(word in query_lower for word in ['mountain', 'mount', 'mt']):
-        return "/static/images/mountain.jpg"
-    elif any(word in query_lower for word in ['desert', 'sahara']):
-        return "/static/images/desert.jpg"
-    elif any(word in query_lower for word in ['forest', 'jungle']):
-        return "/static/images/forest.jpg"
-    elif any(word in query_lower for word in ['city', 'capital']):
-        return "/static/images/city.jpg"
-    else:
-        return "/static/images/globe.jpg"
+    match = KEYWORD_RE.search(query)
+    if match:
+        return KEYWORD_TO_IMAGE[match.group(1).lower()]
+    return "/static/images/globe.jpg"
 
 @app.route('/')
 def home():
@@ -217,7 +570,7 @@ def home():
     return render_template('index.html')
 
 @app.route('/get_question', methods=['GET'])
-def get_question():
+async def get_question():
     try:
         init_session()
         
@@ -232,30 +585,59 @@ def get_question():
         max_retries = 3
         question_data = None
         
+        def _prefetch_image(answer):
+            # Runs in the Gemini worker thread mid-stream; warms the
+            # image cache while the rest of the reply streams in
+            run_in_io_loop(get_location_image(answer))
+
         for attempt in range(max_retries):
             try:
-                question_data = generate_question(difficulty)
+                question_data = await asyncio.to_thread(
+                    generate_question, difficulty, _prefetch_image)
                 if question_data:
                     break
+            except google_exceptions.InvalidArgument as e:
+                # Permanent error; retrying would just repeat it
+                print(f"Gemini rejected the request: {str(e)}")
+                break
             except Exception as e:
                 print(f"Attempt {attempt + 1} failed: {str(e)}")
                 if attempt == max_retries - 1:
-                    raise
+                    break
+                # Exponential backoff with jitter (1s, 2s, ...) so rate
+                # limits and transient failures aren't hammered
+                await asyncio.sleep(min(8, 2 ** attempt + random.random()))
 
         if not question_data:
-            raise Exception("Failed to generate question after retries")
+            # Retries exhausted or permanently rejected: serve a
+            # predefined fallback rather than failing the request
+            question_data = await asyncio.to_thread(
+                generate_question, difficulty, None, False)
 
-        # Track used questions
-        session['used_questions'] = session.get('used_questions', []) + [question_data['question']]
+        # Track used questions as fixed-size hashes, FIFO-capped
+        used_hashes = session.get('used_q_hashes', [])
+        used_hashes.append(_question_hash(question_data['question']))
+        session['used_q_hashes'] = used_hashes[-USED_HASHES_MAX:]
         
-        # Get image URL - do this before storing in session
-        image_url = get_location_image(question_data['correct_answer'])
+        # Fetch images for all four options concurrently - one round of
+        # Foursquare latency instead of four, and the distractor lookups
+        # warm the connection pool for later questions
+        image_results = await asyncio.wrap_future(
+            run_in_io_loop(_gather_option_images(question_data['options']))
+        )
+        image_url = image_results[
+            question_data['options'].index(question_data['correct_answer'])
+        ]
+        # Hand the client a cacheable proxied path, not the raw CDN URL
+        image_url = _proxy_image_url(image_url)
         
         # Store current question
         session['current_question'] = {
             **question_data,
             'image_url': image_url,
-            'timestamp': datetime.now().isoformat()
+            # Second precision keeps the ISO format but skips the
+            # microsecond formatting work on every question
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds')
         }
         
         return jsonify({
@@ -304,7 +686,11 @@ def check_answer():
             'difficulty': current_question['difficulty'],
             'timestamp': current_question['timestamp']
         }
-        session['history'] = session.get('history', []) + [history_entry]
+        history = session.get('history', [])
+        history.append(history_entry)
+        del history[:-HISTORY_MAX]
+        session['history'] = history
+        session.modified = True
         
         return jsonify({
             'is_correct': is_correct,
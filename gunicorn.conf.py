@@ -0,0 +1,9 @@
+import multiprocessing
+import os
+
+# Every route is I/O-bound (Gemini + Foursquare), so threaded workers
+# let many requests wait on the network concurrently per process
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = multiprocessing.cpu_count()
+worker_class = "gthread"
+threads = 16
@@ -0,0 +1,45 @@
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client():
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as client:
+        yield client
+
+
+def test_home_without_redis(client):
+    # Cookie sessions are the fallback when REDIS_URL is unset; the
+    # session cookie must serialize even with the orjson provider
+    response = client.get('/')
+    assert response.status_code == 200
+
+
+def test_get_history_roundtrip(client):
+    response = client.get('/get_history')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['score'] == 0
+    assert data['total_questions'] == 0
+    assert data['history'] == []
+
+
+def test_check_answer_without_question(client):
+    response = client.post('/check_answer', json={'answer': 'Canada'})
+    assert response.status_code == 400
+
+
+def test_img_rejects_mismatched_digest(client):
+    response = client.get('/img/' + '0' * 40,
+                          query_string={'u': 'https://fastly.4sqi.net/img/x.jpg'})
+    assert response.status_code == 404
+
+
+def test_img_rejects_non_foursquare_url(client):
+    import hashlib
+    url = 'https://example.com/x.jpg'
+    digest = hashlib.sha1(url.encode()).hexdigest()
+    response = client.get(f'/img/{digest}', query_string={'u': url})
+    assert response.status_code == 404